@@ -9,19 +9,273 @@
 日期：2026-01-16
 """
 
+import atexit
+import hashlib
+import heapq
 import json
+import operator
 import os
-from collections import defaultdict, deque
+import shelve
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, List, Set, Any, Optional, Tuple
 
+# 优先使用orjson（C实现，解析大文件快3-10倍），未安装时回退到标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 可选的预编译schema校验器，未安装时回退到纯Python逐字段检查
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+# 可选的摊还式有序容器，未安装时回退到append加末尾一次Timsort
+try:
+    from sortedcontainers import SortedList
+except ImportError:
+    SortedList = None
+
+
+def loads_json(data: bytes) -> Any:
+    """
+    反序列化JSON字节串（优先orjson，回退标准库json）
+
+    参数:
+        data: JSON字节串
+
+    返回:
+        解析后的Python对象
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(obj: Any) -> bytes:
+    """
+    将Python对象序列化为带缩进的JSON字节串（优先orjson，回退标准库json）
+
+    参数:
+        obj: 待序列化的Python对象
+
+    返回:
+        UTF-8编码的JSON字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def dumps_json_compact(obj: Any) -> bytes:
+    """
+    将Python对象序列化为紧凑JSON字节串（优先orjson，回退标准库json）
+
+    参数:
+        obj: 待序列化的Python对象
+
+    返回:
+        UTF-8编码的JSON字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
 
 # 日志必需字段定义
-REQUIRED_FIELDS = ['log_id', 'trace_id', 'node_id', 'event_type', 
+REQUIRED_FIELDS = ['log_id', 'trace_id', 'node_id', 'event_type',
                    'timestamp_ms', 'logical_clock', 'payload', 'causal_ref']
 
+# frozenset用于C层的集合差分字段检查；itemgetter一次取出全部字段
+REQUIRED_FIELDS_SET = frozenset(REQUIRED_FIELDS)
+_FIELDS_GETTER = operator.itemgetter(*REQUIRED_FIELDS)
+
 # 有效的事件类型
 VALID_EVENT_TYPES = {'INIT', 'PROCESS', 'END'}
 
+# intern后的事件类型常量，配合ingestion阶段的intern做指针级比较
+_INIT = sys.intern('INIT')
+_END = sys.intern('END')
+
+# 日志结构schema，与validate_log的纯Python检查语义一致
+# （number不含布尔值；causal_ref可为null）
+_LOG_SCHEMA = {
+    'type': 'object',
+    'required': REQUIRED_FIELDS,
+    'properties': {
+        'log_id': {'type': 'string', 'minLength': 1},
+        'trace_id': {'type': 'string', 'minLength': 1},
+        'node_id': {'type': 'string'},
+        'event_type': {'enum': sorted(VALID_EVENT_TYPES)},
+        'timestamp_ms': {'type': 'number'},
+        'logical_clock': {'type': 'number'},
+        'payload': {'type': 'object'},
+        'causal_ref': {'type': ['string', 'null']},
+    },
+}
+
+# fastjsonschema在导入期把schema编译成专用校验函数，校验成本接近C层
+if fastjsonschema is not None:
+    _validate_log_schema = fastjsonschema.compile(_LOG_SCHEMA)
+else:
+    _validate_log_schema = None
+
+# 拓扑排序用的内部排序键（写入日志字典，输出前清理）
+_SORT_KEY = '_sort_key'
+_SORT_KEY_GETTER = operator.itemgetter(_SORT_KEY)
+
+# 拓扑排序结果的磁盘缓存：按trace内容哈希为键，重复运行时直接复用排序结果
+# 版本号参与哈希，排序算法变更时旧缓存自动失效
+_TOPO_CACHE_VERSION = b'topo-v2'
+_TOPO_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'timeline')
+_topo_cache = None  # 延迟打开；False表示缓存不可用
+
+
+def _get_topo_cache():
+    """
+    懒加载拓扑排序结果缓存（shelve），缓存不可用时返回None并禁用缓存
+
+    损坏的缓存文件可能抛出dbm.error、pickle错误甚至SyntaxError
+    （dumbdbm的.dir文件被截断时），因此这里宽泛地捕获Exception——
+    缓存只是加速手段，任何异常都不应阻断正常处理。
+    """
+    global _topo_cache
+    if _topo_cache is None:
+        # 多进程并行时禁用缓存，避免多个worker并发写同一shelve文件
+        if os.environ.get('TIMELINE_NO_TOPO_CACHE'):
+            _topo_cache = False
+            return None
+        try:
+            os.makedirs(_TOPO_CACHE_DIR, exist_ok=True)
+            _topo_cache = shelve.open(os.path.join(_TOPO_CACHE_DIR, 'topo_sort'))
+            atexit.register(_topo_cache.close)
+        except Exception:
+            _topo_cache = False
+    return _topo_cache or None
+
+
+def _disable_topo_cache() -> None:
+    """
+    运行期间读写缓存出错（文件损坏、pickle截断等）时在本进程内禁用缓存
+    """
+    global _topo_cache
+    try:
+        if _topo_cache:
+            _topo_cache.close()
+    except Exception:
+        pass
+    _topo_cache = False
+
+
+def _trace_content_key(trace_logs: List[Dict]) -> str:
+    """
+    计算trace内容哈希作为缓存键（仅包含影响排序结果的字段）
+
+    参数:
+        trace_logs: 同一trace下的所有日志
+
+    返回:
+        十六进制摘要字符串
+    """
+    items = sorted((log['log_id'], log['logical_clock'],
+                    log['timestamp_ms'], log['causal_ref'] or '')
+                   for log in trace_logs)
+    return hashlib.blake2b(repr(items).encode('utf-8'),
+                           key=_TOPO_CACHE_VERSION).hexdigest()
+
+
+def is_ndjson_input(first_line: bytes) -> bool:
+    """
+    根据文件首行判断输入是否为NDJSON格式（每行一条日志）
+
+    首行能独立解析为包含log_id字段的JSON对象时视为NDJSON；
+    解析失败（整体JSON被美化成多行）或解析出raw_logs包装对象等
+    其他结构时走整体JSON路径。不对整体JSON的键顺序做任何假设。
+
+    参数:
+        first_line: 文件的第一行
+
+    返回:
+        是否为NDJSON格式
+    """
+    stripped = first_line.lstrip()
+    if not stripped.startswith(b'{'):
+        return False
+    try:
+        obj = loads_json(stripped)
+    except ValueError:
+        return False
+    return isinstance(obj, dict) and 'log_id' in obj
+
+
+def _iter_json_lines(lines):
+    """
+    逐行解析JSON日志行
+
+    无法解析的行原样产出（字节串），由validate_log按格式错误日志
+    处理，单条坏行不会中断整个文件的解析。
+
+    参数:
+        lines: 可迭代的字节串行（文件对象或列表）
+
+    返回:
+        日志对象的生成器
+    """
+    for line in lines:
+        if line.strip():
+            try:
+                yield loads_json(line)
+            except ValueError:
+                yield line
+
+
+def iter_raw_logs(input_file: str):
+    """
+    逐条迭代输入文件中的原始日志
+
+    支持两种输入格式：
+    - NDJSON：每行一条日志，逐行流式解析，避免一次性在内存中
+      构建整个日志列表，大文件的峰值内存占用约减半
+    - 整体JSON：{"raw_logs": [...]} 结构，整体解析后逐条产出
+
+    首行异常的NDJSON（如首条记录不含log_id甚至不是合法JSON）会被
+    误判为整体JSON；整体解析失败的多行文件因此回退为逐行解析，
+    保证单条坏记录只进malformed_logs而不中断处理。
+
+    参数:
+        input_file: 输入文件路径
+
+    返回:
+        日志对象的生成器
+    """
+    with open(input_file, 'rb') as f:
+        first_line = f.readline()
+        f.seek(0)
+        if is_ndjson_input(first_line):
+            yield from _iter_json_lines(f)
+            return
+        raw = f.read()
+
+    try:
+        data = loads_json(raw)
+    except ValueError:
+        # 多行文件整体解析失败：按NDJSON逐行解析兜底；
+        # 单行文件无从回退，给出明确的格式错误
+        if b'\n' not in raw.strip():
+            raise ValueError(
+                f"无法识别的输入文件格式（非法JSON）：{input_file}")
+        yield from _iter_json_lines(raw.splitlines())
+        return
+
+    if isinstance(data, list):
+        yield from data
+    else:
+        yield from data.get('raw_logs', [])
+
 
 def validate_log(log: Any) -> Tuple[bool, Optional[str]]:
     """
@@ -36,46 +290,57 @@ def validate_log(log: Any) -> Tuple[bool, Optional[str]]:
     # 检查是否为字典类型
     if not isinstance(log, dict):
         return False, None
-    
+
     # 检查log_id是否存在且为字符串
+    # JSON解析产出的都是精确类型，用type(x) is判断比isinstance更快
     log_id = log.get('log_id')
-    if not isinstance(log_id, str) or not log_id:
+    if type(log_id) is not str or not log_id:
         return False, None
-    
-    # 检查所有必需字段是否存在
-    for field in REQUIRED_FIELDS:
-        if field not in log:
+
+    # 安装了fastjsonschema时走预编译校验器，一次调用完成全部结构检查
+    if _validate_log_schema is not None:
+        try:
+            _validate_log_schema(log)
+        except fastjsonschema.JsonSchemaException:
             return False, log_id
-    
+        return True, log_id
+
+    # 用一次C层集合差分检查所有必需字段是否齐全
+    if REQUIRED_FIELDS_SET - log.keys():
+        return False, log_id
+
+    # 一次itemgetter取出全部字段，后续检查只访问局部变量，不再做字典查找
+    (_, trace_id, node_id, event_type,
+     timestamp_ms, logical_clock, payload, causal_ref) = _FIELDS_GETTER(log)
+
     # 检查trace_id是否为有效字符串
-    if not isinstance(log.get('trace_id'), str) or not log.get('trace_id'):
+    if type(trace_id) is not str or not trace_id:
         return False, log_id
-    
+
     # 检查node_id是否为有效字符串
-    if not isinstance(log.get('node_id'), str):
+    if type(node_id) is not str:
         return False, log_id
-    
+
     # 检查event_type是否有效
-    if log.get('event_type') not in VALID_EVENT_TYPES:
+    if event_type not in VALID_EVENT_TYPES:
         return False, log_id
-    
+
     # 检查timestamp_ms是否为有效数字
-    if not isinstance(log.get('timestamp_ms'), (int, float)):
+    if type(timestamp_ms) is not int and type(timestamp_ms) is not float:
         return False, log_id
-    
+
     # 检查logical_clock是否为有效数字
-    if not isinstance(log.get('logical_clock'), (int, float)):
+    if type(logical_clock) is not int and type(logical_clock) is not float:
         return False, log_id
-    
+
     # 检查payload是否为字典类型（对象）
-    if not isinstance(log.get('payload'), dict):
+    if type(payload) is not dict:
         return False, log_id
-    
+
     # 检查causal_ref（可以为null或字符串）
-    causal_ref = log.get('causal_ref')
-    if causal_ref is not None and not isinstance(causal_ref, str):
+    if causal_ref is not None and type(causal_ref) is not str:
         return False, log_id
-    
+
     return True, log_id
 
 
@@ -176,182 +441,310 @@ def check_trace_completeness(trace_logs: List[Dict], log_index: Dict[str, Dict])
     return True, "complete"
 
 
-def topological_sort_trace(trace_logs: List[Dict], log_index: Dict[str, Dict]) -> List[Dict]:
+def topological_sort_trace(trace_logs: List[Dict], log_index: Dict[str, Dict],
+                           row_of: Optional[Dict[str, int]] = None
+                           ) -> Tuple[float, List[Dict]]:
     """
     对单个trace内的日志进行拓扑排序
-    
+
     参数:
         trace_logs: 同一trace下的所有日志
         log_index: 全局log_id索引
-        
+        row_of: 可选的log_id到行号映射（行号即日志在trace_logs中的下标）；
+                调用方在扫描阶段已有此映射时传入可避免重复构建
+
     返回:
-        按因果顺序排列的日志列表
+        (trace内最小时间戳, 按因果顺序排列的日志列表)
     """
-    # 构建trace内的log_id集合
-    trace_log_ids = {log['log_id'] for log in trace_logs}
-    
-    # 构建邻接表和入度表
-    # 如果 A.causal_ref == B.log_id，则 B -> A（B是A的前驱）
-    in_degree = {log['log_id']: 0 for log in trace_logs}
-    graph = defaultdict(list)  # parent -> children
-    
-    for log in trace_logs:
-        causal_ref = log.get('causal_ref')
-        if causal_ref is not None and causal_ref in trace_log_ids:
-            graph[causal_ref].append(log['log_id'])
-            in_degree[log['log_id']] += 1
-    
-    # Kahn算法进行拓扑排序
-    # 对于同层级的节点，按logical_clock和timestamp_ms排序
-    queue = []
+    # 给trace内每条日志分配整数行号，图与入度全部用整型索引表示，
+    # 边遍历不再做字符串哈希（CSR思路的纯Python版）
+    n = len(trace_logs)
+    if row_of is None:
+        row_of = {log['log_id']: i for i, log in enumerate(trace_logs)}
+
+    # 查询内容哈希缓存：同一trace内容在以往运行中排过序时直接复用其顺序
+    cache = _get_topo_cache()
+    cache_key = None
+    if cache is not None:
+        cache_key = _trace_content_key(trace_logs)
+        try:
+            cached = cache.get(cache_key)
+        except Exception:
+            # 缓存值损坏（截断的pickle等）：禁用缓存，正常排序
+            _disable_topo_cache()
+            cache = None
+            cached = None
+        if cached is not None:
+            min_ts, order = cached
+            return min_ts, [trace_logs[row_of[lid]] for lid in order]
+
+    # 预计算排序键：每条日志只取一次字典值，排序比较时不再逐次查字典
+    # （时间戳为毫秒级epoch值，不适合位打包，用元组保持精确比较）
     for log in trace_logs:
-        if in_degree[log['log_id']] == 0:
-            queue.append(log)
-    
-    # 按logical_clock和timestamp_ms排序队列
-    queue.sort(key=lambda x: (x['logical_clock'], x['timestamp_ms']))
-    queue = deque(queue)
-    
+        log[_SORT_KEY] = (log['logical_clock'], log['timestamp_ms'])
+
+    # 构建邻接表和入度表（均按行号索引）
+    # 如果 A.causal_ref == B.log_id，则 B -> A（B是A的前驱）
+    # 入度表用bytearray：连续的单字节缓冲区，每节点最多一个前驱
+    # （causal_ref唯一），uint8绰绰有余
+    in_degree = bytearray(n)
+    children = [[] for _ in range(n)]  # 父行号 -> 子行号列表
+
+    for i, log in enumerate(trace_logs):
+        causal_ref = log['causal_ref']
+        if causal_ref is not None:
+            parent = row_of.get(causal_ref)
+            if parent is not None:
+                children[parent].append(i)
+                in_degree[i] += 1
+
+    # Kahn算法+优先堆进行拓扑排序
+    # 堆中始终保存当前所有入度为0的节点，每次弹出排序键最小的一个，
+    # 取代原先的逐批list.sort+deque（整体复杂度O((V+E) log V)）
+    # 堆元素为(排序键, log_id, 行号)，log_id用于确定性地打破平局
+    heap = [(log[_SORT_KEY], log['log_id'], i)
+            for i, log in enumerate(trace_logs) if in_degree[i] == 0]
+    heapq.heapify(heap)
+
     sorted_logs = []
-    log_dict = {log['log_id']: log for log in trace_logs}
-    
-    while queue:
-        # 从队列中取出所有入度为0的节点，按顺序处理
-        current = queue.popleft()
+
+    while heap:
+        _, _, row = heapq.heappop(heap)
+        current = trace_logs[row]
         sorted_logs.append(current)
-        
-        # 获取当前节点的所有后继
-        children = graph[current['log_id']]
-        next_batch = []
-        
-        for child_id in children:
-            in_degree[child_id] -= 1
-            if in_degree[child_id] == 0:
-                next_batch.append(log_dict[child_id])
-        
-        # 对新的入度为0的节点按logical_clock和timestamp_ms排序后加入队列
-        next_batch.sort(key=lambda x: (x['logical_clock'], x['timestamp_ms']))
-        for log in next_batch:
-            queue.append(log)
-    
-    return sorted_logs
 
+        # 当前节点的后继入度减一，降为0的进入堆
+        for child_row in children[row]:
+            in_degree[child_row] -= 1
+            if in_degree[child_row] == 0:
+                child = trace_logs[child_row]
+                heapq.heappush(heap, (child[_SORT_KEY], child['log_id'], child_row))
+
+    # trace的最小时间戳按排序结果统计：困在因果环中的日志不进入时间线，
+    # 也不应影响trace在时间线中的位置（空结果与基线一致取inf）
+    min_ts = min((log['timestamp_ms'] for log in sorted_logs),
+                 default=float('inf'))
+
+    # 清理内部排序键，避免写入输出
+    for log in trace_logs:
+        del log[_SORT_KEY]
+
+    # 回填缓存（只存log_id顺序，日志内容不落盘）
+    if cache is not None:
+        try:
+            cache[cache_key] = (min_ts, [log['log_id'] for log in sorted_logs])
+        except Exception:
+            _disable_topo_cache()
+
+    return min_ts, sorted_logs
+
+
+def write_output(output: Dict, output_file: str, pretty: bool = False) -> None:
+    """
+    写出处理结果
 
-def process_logs(input_file: str, output_file: str) -> None:
+    默认增量写出：sorted_timeline逐条序列化（每行一条），整份输出
+    不需要一次性在内存中构建序列化串，输出仍是单个合法JSON文档。
+    pretty=True时走一次性带缩进的序列化，便于人工阅读。
+
+    参数:
+        output: 处理结果字典
+        output_file: 输出文件路径
+        pretty: 是否输出带缩进的JSON
+    """
+    if pretty:
+        with open(output_file, 'wb') as f:
+            f.write(dumps_json(output))
+        return
+
+    sorted_timeline = output['sorted_timeline']
+    anomaly_report = output['anomaly_report']
+    with open(output_file, 'wb') as f:
+        f.write(b'{"sorted_timeline": [\n')
+        first = True
+        for log in sorted_timeline:
+            if not first:
+                f.write(b',\n')
+            first = False
+            f.write(dumps_json_compact(log))
+        f.write(b'\n], "anomaly_report": ')
+        f.write(dumps_json_compact(anomaly_report))
+        f.write(b'}\n')
+
+
+def process_logs(input_file: str, output_file: str, pretty: bool = False) -> None:
     """
     主处理函数：读取日志文件，进行时序重构和异常检测
-    
+
     参数:
         input_file: 输入文件路径
         output_file: 输出文件路径
+        pretty: 是否输出带缩进的JSON
     """
-    print("正在读取输入文件...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    raw_logs = data.get('raw_logs', [])
-    system_config = data.get('system_config', {})
-    max_clock_drift_ms = system_config.get('max_clock_drift_ms', 5000)
-    
-    print(f"读取完成，共 {len(raw_logs)} 条原始日志")
-    
-    # 第一步：验证日志格式，识别malformed_logs
-    print("正在验证日志格式...")
+    # 第一步：单趟扫描——验证格式、构建索引、按trace分组、收集因果引用
+    # 将原先的验证/建索引/孤儿检测/分组四趟遍历融合为一趟，
+    # 每条日志只做一次字典访问与循环开销
+    print("正在读取并验证日志...")
+    raw_count = 0
     valid_logs = []
-    malformed_logs = []
-    
-    for log in raw_logs:
+    # 异常ID集合：装有sortedcontainers时边插边序（摊还O(log n)），
+    # 否则先append、输出前做一次Timsort（逐条bisect.insort是O(n^2)）
+    if SortedList is not None:
+        malformed_logs = SortedList()
+        add_malformed = malformed_logs.add
+    else:
+        malformed_logs = []
+        add_malformed = malformed_logs.append
+    log_index = {}
+    traces = {}
+    trace_rows = {}  # trace_id -> {log_id: trace内行号}
+    # trace_id -> [是否有INIT, 是否有END, 因果链是否断裂]
+    trace_state = {}
+    causal_refs = []  # (log_id, trace_id, causal_ref)，扫描结束后统一解析
+
+    for log in iter_raw_logs(input_file):
+        raw_count += 1
         is_valid, log_id = validate_log(log)
-        if is_valid:
-            valid_logs.append(log)
-        else:
+        if not is_valid:
             if log_id:
-                malformed_logs.append(log_id)
-    
+                add_malformed(log_id)
+            continue
+        valid_logs.append(log)
+        log_index[log_id] = log
+
+        # intern高重复度的字符串：后续分组、字典查找与比较
+        # 走缓存哈希/指针相等的快路径，同时去重省内存
+        trace_id = sys.intern(log['trace_id'])
+        log['trace_id'] = trace_id
+        event_type = sys.intern(log['event_type'])
+        log['event_type'] = event_type
+        log['node_id'] = sys.intern(log['node_id'])
+
+        trace_list = traces.setdefault(trace_id, [])
+        # 顺手记录log_id到trace内行号的映射，供拓扑排序复用
+        trace_rows.setdefault(trace_id, {})[log_id] = len(trace_list)
+        trace_list.append(log)
+
+        # 边扫描边维护完整性标志，后续不再为此重新遍历各trace
+        state = trace_state.setdefault(trace_id, [False, False, False])
+        if event_type is _INIT:
+            state[0] = True
+        elif event_type is _END:
+            state[1] = True
+
+        causal_ref = log['causal_ref']
+        if causal_ref is not None:
+            causal_refs.append((log_id, trace_id, causal_ref))
+
+    print(f"读取完成，共 {raw_count} 条原始日志")
     print(f"格式验证完成：有效日志 {len(valid_logs)} 条，格式错误日志 {len(malformed_logs)} 条")
-    
-    # 第二步：构建日志索引
-    print("正在构建日志索引...")
-    log_index = build_log_index(valid_logs)
-    
-    # 第三步：检测孤儿日志
-    print("正在检测孤儿日志...")
-    orphaned_log_ids = detect_orphaned_logs(valid_logs, log_index)
-    print(f"孤儿日志数量：{len(orphaned_log_ids)}")
-    
-    # 第四步：按trace_id分组
-    print("正在按trace_id分组...")
-    traces = group_by_trace(valid_logs)
     print(f"共 {len(traces)} 个调用链")
-    
-    # 第五步：检测调用链完整性和时钟漂移
+
+    # 第二步：孤儿日志在扫描结束后统一解析
+    # （扫描过程中索引尚未建全，不能边扫边判）；
+    # 因果引用悬空的trace同时标记为因果链断裂
+    orphaned_log_ids = set()
+    for lid, tid, cref in causal_refs:
+        if cref not in log_index:
+            orphaned_log_ids.add(lid)
+            trace_state[tid][2] = True
+    print(f"孤儿日志数量：{len(orphaned_log_ids)}")
+
+    # 第三步：检测调用链完整性（读取扫描期间维护的标志，O(1)每trace）
     print("正在检测调用链完整性...")
-    corrupted_traces = []
+    if SortedList is not None:
+        corrupted_traces = SortedList()
+        add_corrupted = corrupted_traces.add
+    else:
+        corrupted_traces = []
+        add_corrupted = corrupted_traces.append
     complete_traces = {}
     clock_skew_count = 0
-    
+
     for trace_id, trace_logs in traces.items():
-        is_complete, reason = check_trace_completeness(trace_logs, log_index)
-        if is_complete:
+        has_init, has_end, has_broken = trace_state[trace_id]
+        if has_init and has_end and not has_broken:
             complete_traces[trace_id] = trace_logs
         else:
-            corrupted_traces.append(trace_id)
-    
+            add_corrupted(trace_id)
+
     print(f"完整调用链：{len(complete_traces)} 个，异常调用链：{len(corrupted_traces)} 个")
-    
-    # 第六步：对完整调用链进行拓扑排序，并检测时钟漂移
+
+    # 用Counter对异常原因做一次C层聚合（生成器直接喂给Counter）
+    if corrupted_traces:
+        state_of = trace_state.__getitem__
+        corruption_reasons = Counter(
+            'missing_init' if not state_of(tid)[0]
+            else 'missing_end' if not state_of(tid)[1]
+            else 'broken_causal_chain'
+            for tid in corrupted_traces
+        )
+        print("异常调用链原因分布：" + "，".join(
+            f"{reason}={count}" for reason, count
+            in sorted(corruption_reasons.items())))
+    
+    # 第四步：对完整调用链进行拓扑排序，并检测时钟漂移
     print("正在进行拓扑排序...")
     sorted_timeline = []
     
-    # 首先收集所有完整trace的排序结果
+    # 首先收集所有完整trace的排序结果（最小时间戳由排序过程顺带给出）
     all_sorted_traces = []
+    parent_of = log_index.__getitem__
     for trace_id, trace_logs in complete_traces.items():
-        sorted_trace = topological_sort_trace(trace_logs, log_index)
-        all_sorted_traces.append((trace_id, sorted_trace))
-        
-        # 检测时钟漂移
-        for log in sorted_trace:
-            causal_ref = log.get('causal_ref')
-            if causal_ref is not None and causal_ref in log_index:
-                parent_log = log_index[causal_ref]
-                if detect_clock_skew(log, parent_log):
-                    clock_skew_count += 1
-    
-    # 按trace中第一个日志的时间戳排序所有trace，然后合并
-    all_sorted_traces.sort(key=lambda x: (
-        min(log['timestamp_ms'] for log in x[1]) if x[1] else float('inf')
-    ))
-    
-    for trace_id, sorted_trace in all_sorted_traces:
+        min_ts, sorted_trace = topological_sort_trace(trace_logs, log_index,
+                                                      trace_rows[trace_id])
+        all_sorted_traces.append((min_ts, sorted_trace))
+
+        # 检测时钟漂移：完整trace中所有causal_ref必然可解析
+        # （断链的trace已被剔除），用一次C层sum归约替代逐条函数调用
+        # 只统计排序结果中的日志——困在因果环里的日志不进入时间线，
+        # 也不应计入漂移；causal_ref用海象运算符取一次复用
+        clock_skew_count += sum(
+            1 for log in sorted_trace
+            if (causal_ref := log['causal_ref']) is not None
+            and log['timestamp_ms'] < parent_of(causal_ref)['timestamp_ms']
+        )
+
+    # 按各trace的最小时间戳排列后依次拼接
+    # （trace内部必须保持拓扑顺序，不能按时间戳做跨trace交错归并）
+    all_sorted_traces.sort(key=operator.itemgetter(0))
+
+    for min_ts, sorted_trace in all_sorted_traces:
         sorted_timeline.extend(sorted_trace)
     
     print(f"时钟漂移事件数量：{clock_skew_count}")
     
-    # 第七步：构建输出结果
+    # 第五步：构建输出结果
     print("正在构建输出结果...")
+    # 物化为普通有序list：SortedList本身已有序，普通list在此做唯一一次排序
+    if SortedList is not None:
+        corrupted_traces = list(corrupted_traces)
+        malformed_logs = list(malformed_logs)
+    else:
+        corrupted_traces.sort()
+        malformed_logs.sort()
     output = {
         "sorted_timeline": sorted_timeline,
         "anomaly_report": {
-            "corrupted_traces": sorted(corrupted_traces),
+            "corrupted_traces": corrupted_traces,
             "orphaned_logs_count": len(orphaned_log_ids),
             "clock_skew_events_count": clock_skew_count,
-            "malformed_logs": sorted(malformed_logs)
+            "malformed_logs": malformed_logs
         }
     }
     
-    # 确保输出目录存在
+    # 确保输出目录存在（多个worker并发写同一目录时exist_ok避免竞态）
     output_dir = os.path.dirname(output_file)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
     
     # 写入输出文件
     print(f"正在写入输出文件：{output_file}")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    write_output(output, output_file, pretty)
     
     print("处理完成！")
     print(f"\n===== 处理结果摘要 =====")
-    print(f"原始日志总数：{len(raw_logs)}")
+    print(f"原始日志总数：{raw_count}")
     print(f"有效日志数量：{len(valid_logs)}")
     print(f"排序后时间线日志数量：{len(sorted_timeline)}")
     print(f"格式错误日志数量：{len(malformed_logs)}")
@@ -362,19 +755,49 @@ def process_logs(input_file: str, output_file: str) -> None:
 
 def main():
     """
-    主函数入口
+    主函数入口：处理input目录下的所有JSON输入文件
+
+    单个输入文件时串行处理；多个输入文件时各文件相互独立，
+    用进程池并行处理以绕开GIL，按CPU核数扩展。
+
+    命令行参数：
+        --pretty: 输出带缩进的JSON（默认增量写出紧凑格式）
     """
-    # 设置输入输出路径
-    input_file = os.path.join('input', 'input.json')
-    output_file = os.path.join('output', 'output.json')
-    
-    # 检查输入文件是否存在
-    if not os.path.exists(input_file):
-        print(f"错误：输入文件不存在：{input_file}")
+    pretty = '--pretty' in sys.argv[1:]
+    input_dir = 'input'
+    output_dir = 'output'
+
+    # 收集输入目录下的所有JSON文件，输出文件与输入同名
+    if not os.path.isdir(input_dir):
+        print(f"错误：输入目录不存在：{input_dir}")
         return
-    
-    # 执行处理
-    process_logs(input_file, output_file)
+
+    input_files = sorted(
+        os.path.join(input_dir, name)
+        for name in os.listdir(input_dir)
+        if name.endswith('.json')
+    )
+    if not input_files:
+        print(f"错误：输入目录中没有JSON文件：{input_dir}")
+        return
+
+    # 保持README约定：input.json 对应 output.json；其余输入输出同名
+    output_files = []
+    for path in input_files:
+        name = os.path.basename(path)
+        if name == 'input.json':
+            name = 'output.json'
+        output_files.append(os.path.join(output_dir, name))
+
+    if len(input_files) == 1:
+        process_logs(input_files[0], output_files[0], pretty)
+        return
+
+    # 并行时禁用拓扑排序磁盘缓存，避免多个worker并发写同一shelve文件
+    os.environ['TIMELINE_NO_TOPO_CACHE'] = '1'
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(process_logs, input_files, output_files,
+                          [pretty] * len(input_files)))
 
 
 if __name__ == '__main__':